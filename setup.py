@@ -50,6 +50,9 @@ Topic :: System :: Archiving :: Backup
         #'psycopg2>=2.6.1',
         #'pex==1.1.0',
         ],
+    extras_require={
+        'asyncio': ['aioboto3'],  # use_asyncio in the s3 data backend
+        },
     # tests_require=[
         # 'pytest-cov',
         # 'pytest-capturelog',
@@ -35,10 +35,12 @@ class DataBackend():
         # 32 chars are allowed and we need to spread the first few chars so
         # that blobs are distributed nicely. And want to avoid hash collisions.
         # So we create a real base57-encoded uuid (22 chars) and prefix it with
-        # its own md5 hash[:10].
+        # a 5 byte (10 hex chars) blake2b hash of itself. This is no security
+        # feature, blake2b is just cheaper than md5 (which goes through
+        # openssl) and produces exactly the 10 chars we need.
         suuid = shortuuid.uuid()
-        hash = hashlib.md5(suuid.encode('ascii')).hexdigest()
-        return hash[:10] + suuid
+        hash = hashlib.blake2b(suuid.encode('ascii'), digest_size=5).hexdigest()
+        return hash + suuid
 
 
     def save(self, data, _sync=False, callback=None):
@@ -56,12 +58,24 @@ class DataBackend():
         blob, enc_envkey, enc_nonce = self.cc_latest.encrypt(data)
         enc_version = self.cc_latest.VERSION
 
-        self._write_queue.put((uid, enc_envkey, enc_version, enc_nonce, blob, callback))
-        if _sync:
-            self._write_queue.join()
+        self._enqueue_write((uid, enc_envkey, enc_version, enc_nonce, blob, callback), _sync)
         return uid
 
 
+    def _enqueue_write(self, entry, sync=False):
+        """ Hands a write job to the writers. If sync is True, waits until
+        all write jobs are done.
+        """
+        self._write_queue.put(entry)
+        if sync:
+            self._write_queue.join()
+
+
+    def _enqueue_read(self, block):
+        """ Hands a read job to the readers """
+        self._read_queue.put(block)
+
+
     def update(self, uid, data, offset=0):
         """ Updates data, returns written bytes.
         This is only available on *some* data backends.
@@ -75,7 +89,7 @@ class DataBackend():
         Do not mix sync and non-sync reads in one program!
         With length==None, all known data is read for this uid.
         """
-        self._read_queue.put(block)
+        self._enqueue_read(block)
         if sync:
             rblock, offset, length, data = self.read_get()
             if rblock.id != block.id:
@@ -108,7 +122,6 @@ class DataBackend():
 
         offset = 0
         length = len(data)
-        self._read_data_queue.task_done()
         return block, offset, length, data
 
 
@@ -155,14 +168,17 @@ class DataBackend():
 
 
     def thread_status(self):
+        # one snapshot, so the counts add up even while threads change state
+        readers = bytes(self.reader_thread_status)
+        writers = bytes(self.writer_thread_status)
         return "DaBaR: N{} R{} T{} QL{}  DaBaW: N{} W{} T{} QL{}".format(
-                len([t for t in self.reader_thread_status.values() if t==STATUS_NOTHING]),
-                len([t for t in self.reader_thread_status.values() if t==STATUS_READING]),
-                len([t for t in self.reader_thread_status.values() if t==STATUS_THROTTLING]),
+                readers.count(STATUS_NOTHING),
+                readers.count(STATUS_READING),
+                readers.count(STATUS_THROTTLING),
                 self._read_queue.qsize(),
-                len([t for t in self.writer_thread_status.values() if t==STATUS_NOTHING]),
-                len([t for t in self.writer_thread_status.values() if t==STATUS_WRITING]),
-                len([t for t in self.writer_thread_status.values() if t==STATUS_THROTTLING]),
+                writers.count(STATUS_NOTHING),
+                writers.count(STATUS_WRITING),
+                writers.count(STATUS_THROTTLING),
                 self._write_queue.qsize(),
                 )
 
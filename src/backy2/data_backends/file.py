@@ -4,7 +4,9 @@
 from backy2.data_backends import DataBackend as _DataBackend
 from backy2.data_backends import (STATUS_NOTHING, STATUS_READING, STATUS_WRITING, STATUS_THROTTLING, STATUS_QUEUE)
 from backy2.logging import logger
+from backy2.utils import HandoffQueue
 from backy2.utils import TokenBucket
+import array
 import fnmatch
 import os
 import queue
@@ -51,23 +53,21 @@ class DataBackend(_DataBackend):
 
         self._write_queue = queue.Queue(self.write_queue_length)
         self._read_queue = queue.Queue()
-        self._read_data_queue = queue.Queue(self.read_queue_length)
+        self._read_data_queue = HandoffQueue(self.read_queue_length)
         self._writer_threads = []
         self._reader_threads = []
-        self.reader_thread_status = {}
-        self.writer_thread_status = {}
+        self.reader_thread_status = array.array('B', [STATUS_NOTHING] * simultaneous_reads)
+        self.writer_thread_status = array.array('B', [STATUS_NOTHING] * simultaneous_writes)
         for i in range(simultaneous_writes):
             _writer_thread = threading.Thread(target=self._writer, args=(i,))
             _writer_thread.daemon = True
             _writer_thread.start()
             self._writer_threads.append(_writer_thread)
-            self.writer_thread_status[i] = STATUS_NOTHING
         for i in range(simultaneous_reads):
             _reader_thread = threading.Thread(target=self._reader, args=(i,))
             _reader_thread.daemon = True
             _reader_thread.start()
             self._reader_threads.append(_reader_thread)
-            self.reader_thread_status[i] = STATUS_NOTHING
 
 
 
@@ -82,9 +82,10 @@ class DataBackend(_DataBackend):
 
             path = os.path.join(self.path, self._path(uid))
             filename = self._filename(uid)
-            self.writer_thread_status[id_] = STATUS_THROTTLING
-            time.sleep(self.write_throttling.consume(len(data)))
-            self.writer_thread_status[id_] = STATUS_NOTHING
+            if self.write_throttling.rate:  # 0 disables throttling
+                self.writer_thread_status[id_] = STATUS_THROTTLING
+                time.sleep(self.write_throttling.consume(len(data)))
+                self.writer_thread_status[id_] = STATUS_NOTHING
             t1 = time.time()
             try:
                 try:
@@ -178,7 +179,8 @@ class DataBackend(_DataBackend):
         if not os.path.exists(filename):
             raise FileNotFoundError('File {} not found.'.format(filename))
         data = open(filename, 'rb').read()
-        time.sleep(self.read_throttling.consume(len(data)))
+        if self.read_throttling.rate:
+            time.sleep(self.read_throttling.consume(len(data)))
         return data
 
 
@@ -4,6 +4,7 @@
 from backy2.data_backends import DataBackend as _DataBackend
 from backy2.data_backends import (STATUS_NOTHING, STATUS_READING, STATUS_WRITING, STATUS_THROTTLING, STATUS_QUEUE)
 from backy2.logging import logger
+from backy2.utils import HandoffQueue
 from backy2.utils import TokenBucket
 
 import boto3
@@ -15,6 +16,7 @@ from minio import Minio
 from minio.error import (ResponseError, BucketAlreadyOwnedByYou,
                          BucketAlreadyExists)
 
+import array
 import io
 import os
 import queue
@@ -66,26 +68,24 @@ class DataBackend(_DataBackend):
         self.read_queue_length = simultaneous_reads + self.READ_QUEUE_LENGTH
         self._write_queue = queue.Queue(self.write_queue_length)
         self._read_queue = queue.Queue()
-        self._read_data_queue = queue.Queue(self.read_queue_length)
+        self._read_data_queue = HandoffQueue(self.read_queue_length)
 
         self.client = self._get_client()  # for read_raw, rm, ...
 
         self._writer_threads = []
         self._reader_threads = []
-        self.reader_thread_status = {}
-        self.writer_thread_status = {}
+        self.reader_thread_status = array.array('B', [STATUS_NOTHING] * simultaneous_reads)
+        self.writer_thread_status = array.array('B', [STATUS_NOTHING] * simultaneous_writes)
         for i in range(simultaneous_writes):
             _writer_thread = threading.Thread(target=self._writer, args=(i,))
             _writer_thread.daemon = True
             _writer_thread.start()
             self._writer_threads.append(_writer_thread)
-            self.writer_thread_status[i] = STATUS_NOTHING
         for i in range(simultaneous_reads):
             _reader_thread = threading.Thread(target=self._reader, args=(i,))
             _reader_thread.daemon = True
             _reader_thread.start()
             self._reader_threads.append(_reader_thread)
-            self.reader_thread_status[i] = STATUS_NOTHING
 
 
     def _get_client(self):
@@ -111,9 +111,10 @@ class DataBackend(_DataBackend):
                 client = self._get_client()
             uid, enc_envkey, enc_version, enc_nonce, data, callback = entry
 
-            self.writer_thread_status[id_] = STATUS_THROTTLING
-            time.sleep(self.write_throttling.consume(len(data)))
-            self.writer_thread_status[id_] = STATUS_NOTHING
+            if self.write_throttling.rate:  # 0 disables throttling
+                self.writer_thread_status[id_] = STATUS_THROTTLING
+                time.sleep(self.write_throttling.consume(len(data)))
+                self.writer_thread_status[id_] = STATUS_NOTHING
 
             try:
                 self.writer_thread_status[id_] = STATUS_WRITING
@@ -159,7 +160,8 @@ class DataBackend(_DataBackend):
         if not _client:
             _client = self._get_client()
         data = _client.get_object(self.bucket_name, block.uid).read()
-        time.sleep(self.read_throttling.consume(len(data)))  # TODO: Need throttling in thread statistics!
+        if self.read_throttling.rate:  # TODO: Need throttling in thread statistics!
+            time.sleep(self.read_throttling.consume(len(data)))
         return data
 
 
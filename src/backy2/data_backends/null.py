@@ -5,8 +5,10 @@ from backy2.crypt import get_crypt
 from backy2.data_backends import DataBackend as _DataBackend
 from backy2.data_backends import (STATUS_NOTHING, STATUS_READING, STATUS_WRITING, STATUS_THROTTLING, STATUS_QUEUE)
 from backy2.logging import logger
+from backy2.utils import HandoffQueue
 from backy2.utils import TokenBucket
 from backy2.utils import generate_block
+import array
 import binascii
 import os
 import queue
@@ -45,23 +47,21 @@ class DataBackend(_DataBackend):
         self.read_queue_length = simultaneous_reads + self.READ_QUEUE_LENGTH
         self._write_queue = queue.Queue(self.write_queue_length)
         self._read_queue = queue.Queue()
-        self._read_data_queue = queue.Queue(self.read_queue_length)
+        self._read_data_queue = HandoffQueue(self.read_queue_length)
         self._writer_threads = []
         self._reader_threads = []
-        self.reader_thread_status = {}
-        self.writer_thread_status = {}
+        self.reader_thread_status = array.array('B', [STATUS_NOTHING] * simultaneous_reads)
+        self.writer_thread_status = array.array('B', [STATUS_NOTHING] * simultaneous_writes)
         for i in range(simultaneous_writes):
             _writer_thread = threading.Thread(target=self._writer, args=(i,))
             _writer_thread.daemon = True
             _writer_thread.start()
             self._writer_threads.append(_writer_thread)
-            self.writer_thread_status[i] = STATUS_NOTHING
         for i in range(simultaneous_reads):
             _reader_thread = threading.Thread(target=self._reader, args=(i,))
             _reader_thread.daemon = True
             _reader_thread.start()
             self._reader_threads.append(_reader_thread)
-            self.reader_thread_status[i] = STATUS_NOTHING
 
 
     def _writer(self, id_):
@@ -73,9 +73,10 @@ class DataBackend(_DataBackend):
                 break
             uid, enc_envkey, enc_version, enc_nonce, data, callback = entry
 
-            self.writer_thread_status[id_] = STATUS_THROTTLING
-            time.sleep(self.write_throttling.consume(len(data)))
-            self.writer_thread_status[id_] = STATUS_NOTHING
+            if self.write_throttling.rate:  # 0 disables throttling
+                self.writer_thread_status[id_] = STATUS_THROTTLING
+                time.sleep(self.write_throttling.consume(len(data)))
+                self.writer_thread_status[id_] = STATUS_NOTHING
             t1 = time.time()
             try:
                 # storing data to key uid
@@ -110,7 +111,8 @@ class DataBackend(_DataBackend):
             except Exception as e:
                 self.last_exception = e
             else:
-                time.sleep(self.read_throttling.consume(len(data)))
+                if self.read_throttling.rate:
+                    time.sleep(self.read_throttling.consume(len(data)))
                 self.reader_thread_status[id_] = STATUS_NOTHING
                 #time.sleep(.5)
                 self._read_data_queue.put((block, data))
@@ -4,13 +4,21 @@
 from backy2.data_backends import DataBackend as _DataBackend
 from backy2.data_backends import (STATUS_NOTHING, STATUS_READING, STATUS_WRITING, STATUS_THROTTLING, STATUS_QUEUE)
 from backy2.logging import logger
+from backy2.utils import HandoffQueue
 from backy2.utils import TokenBucket
+import array
+import asyncio
 import boto3
 from botocore.client import Config as BotoCoreClientConfig
 from botocore.exceptions import ClientError
 from botocore.handlers import set_list_objects_encoding_type_url
+from concurrent.futures import ThreadPoolExecutor, wait
+import contextlib
 import hashlib
-#import io
+import http.client
+import inspect
+import io
+import itertools
 import os
 import queue
 import random
@@ -18,6 +26,12 @@ import socket
 import sys
 import threading
 import time
+import urllib3.connection
+
+try:
+    import aioboto3
+except ImportError:
+    aioboto3 = None
 
 
 def chunks(lst, n):
@@ -26,6 +40,87 @@ def chunks(lst, n):
         yield lst[i:i + n]
 
 
+def _subclasses(cls):
+    yield cls
+    for subclass in cls.__subclasses__():
+        yield from _subclasses(subclass)
+
+
+def set_http_blocksize(blocksize):
+    """ Sets the default blocksize of http.client's and urllib3's HTTP and
+    HTTPS connections, i.e. how many bytes are read from a request body and
+    sent per socket write. The defaults (8 KiB resp. 16 KiB) mean thousands of
+    small writes, each releasing and re-acquiring the GIL, per block.
+    Subclasses with their own __init__ (e.g. urllib3 2's HTTPSConnection)
+    pass their own default on, so all of them are patched.
+    """
+    for connection_class in set(_subclasses(http.client.HTTPConnection)):
+        init = connection_class.__dict__.get('__init__')
+        if init is None:
+            continue
+        if init.__kwdefaults__ and 'blocksize' in init.__kwdefaults__:
+            init.__kwdefaults__['blocksize'] = blocksize  # keyword-only
+            continue
+        defaults = [p.name for p in inspect.signature(init).parameters.values()
+                if p.default is not p.empty and p.kind == p.POSITIONAL_OR_KEYWORD]
+        if 'blocksize' in defaults and init.__defaults__:
+            init_defaults = list(init.__defaults__)
+            init_defaults[defaults.index('blocksize')] = blocksize
+            init.__defaults__ = tuple(init_defaults)
+
+
+class MemoryViewReader(io.RawIOBase):
+    """ A seekable, read-only file object over a buffer which doesn't copy
+    it. read() returns memoryview slices, which botocore (checksums) and
+    http.client (sendall) consume just like bytes.
+    """
+    def __init__(self, buffer):
+        self._view = memoryview(buffer).toreadonly()
+        self._pos = 0
+
+
+    def __len__(self):
+        return len(self._view)
+
+
+    def readable(self):
+        return True
+
+
+    def seekable(self):
+        return True
+
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            size = len(self._view) - self._pos
+        chunk = self._view[self._pos:self._pos + size]
+        self._pos += len(chunk)
+        return chunk
+
+
+    def readinto(self, buffer):
+        chunk = self.read(len(buffer))
+        buffer[:len(chunk)] = chunk
+        return len(chunk)
+
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_SET:
+            self._pos = offset
+        elif whence == io.SEEK_CUR:
+            self._pos += offset
+        elif whence == io.SEEK_END:
+            self._pos = len(self._view) + offset
+        else:
+            raise ValueError('Invalid whence {}'.format(whence))
+        return self._pos
+
+
+    def tell(self):
+        return self._pos
+
+
 class DataBackend(_DataBackend):
     """ A DataBackend which stores in S3 compatible storages. The files are
     stored in a configurable bucket. """
@@ -33,6 +128,15 @@ class DataBackend(_DataBackend):
     WRITE_QUEUE_LENGTH = 20
     READ_QUEUE_LENGTH = 20
 
+    MULTIPART_THRESHOLD = 8 * 1024 * 1024
+    MULTIPART_CHUNKSIZE = 8 * 1024 * 1024
+    MULTIPART_CONCURRENCY = 4
+    MULTIPART_MIN_CHUNKSIZE = 5 * 1024 * 1024  # s3's minimum size of all but the last part
+    MULTIPART_MAX_PARTS = 10000  # s3's maximum number of parts per upload
+    MULTIPART_DOWNLOAD_THRESHOLD = 8 * 1024 * 1024
+    DOWNLOAD_CHUNKSIZE = 8 * 1024 * 1024
+    HTTP_BLOCKSIZE = 1024 * 1024
+
     last_exception = None
 
     def __init__(self, config, encryption_key, encryption_version=None):
@@ -67,6 +171,22 @@ class DataBackend(_DataBackend):
         self.write_throttling = TokenBucket()
         self.write_throttling.set_rate(bandwidth_write)  # 0 disables throttling
 
+        # Blobs of at least multipart_threshold bytes are uploaded in parts of
+        # multipart_chunksize bytes, multipart_concurrency parts at a time.
+        self.multipart_threshold = config.getint('multipart_threshold', self.MULTIPART_THRESHOLD)
+        self.multipart_chunksize = config.getint('multipart_chunksize', self.MULTIPART_CHUNKSIZE)
+        if self.multipart_chunksize < self.MULTIPART_MIN_CHUNKSIZE:
+            logger.warning('multipart_chunksize {} is below the minimum part size of s3, using {}.'.format(
+                self.multipart_chunksize, self.MULTIPART_MIN_CHUNKSIZE))
+            self.multipart_chunksize = self.MULTIPART_MIN_CHUNKSIZE
+        multipart_concurrency = config.getint('multipart_concurrency', self.MULTIPART_CONCURRENCY)
+        # Blocks of at least multipart_download_threshold bytes are read with
+        # parallel byte-range GETs of download_chunksize bytes.
+        self.multipart_download_threshold = config.getint('multipart_download_threshold', self.MULTIPART_DOWNLOAD_THRESHOLD)
+        self.download_chunksize = config.getint('download_chunksize', self.DOWNLOAD_CHUNKSIZE)
+        self._part_pool = ThreadPoolExecutor(max_workers=multipart_concurrency)
+
+        set_http_blocksize(config.getint('http_blocksize', self.HTTP_BLOCKSIZE))
 
         self._resource_config = {
             'aws_access_key_id': aws_access_key_id,
@@ -89,8 +209,13 @@ class DataBackend(_DataBackend):
         if signature_version:
             resource_config['signature_version'] = signature_version
 
+        # All readers, writers and the part pool share one client and thus
+        # one connection pool.
+        resource_config['max_pool_connections'] = max(simultaneous_reads, simultaneous_writes) * 2 + multipart_concurrency
+        resource_config['tcp_keepalive'] = True
+        resource_config['retries'] = {'max_attempts': 10, 'mode': 'adaptive'}
+
         # TODO
-        #resource_config['max_pool_connections'] = 100
         #resource_config['parameter_validation'] = False
         #resource_config['use_accelerate_endpoint'] = True
 
@@ -99,37 +224,40 @@ class DataBackend(_DataBackend):
 
         self.write_queue_length = simultaneous_writes + self.WRITE_QUEUE_LENGTH
         self.read_queue_length = simultaneous_reads + self.READ_QUEUE_LENGTH
-        self._write_queue = queue.Queue(self.write_queue_length)
-        self._read_queue = queue.Queue()
-        self._read_data_queue = queue.Queue(self.read_queue_length)
-
-        self.bucket = self._get_bucket()  # for read_raw
-
-        self._writer_threads = []
-        self._reader_threads = []
-        self.reader_thread_status = {}
-        self.writer_thread_status = {}
-        for i in range(simultaneous_writes):
-            _writer_thread = threading.Thread(target=self._writer, args=(i,))
-            _writer_thread.daemon = True
-            _writer_thread.start()
-            self._writer_threads.append(_writer_thread)
-            self.writer_thread_status[i] = STATUS_NOTHING
-        for i in range(simultaneous_reads):
-            _reader_thread = threading.Thread(target=self._reader, args=(i,))
-            _reader_thread.daemon = True
-            _reader_thread.start()
-            self._reader_threads.append(_reader_thread)
-            self.reader_thread_status[i] = STATUS_NOTHING
-
-
-    def _get_bucket(self):
-        session = boto3.session.Session()
-        if self._disable_encoding_type:
-            session.events.unregister('before-parameter-build.s3.ListObjects', set_list_objects_encoding_type_url)
-        resource = session.resource('s3', **self._resource_config)
-        bucket = resource.Bucket(self._bucket_name)
-        return bucket
+        # save() blocks while write_queue_length writes are pending
+        self._write_slots = threading.Semaphore(self.write_queue_length)
+        self._write_futures = set()
+        self._read_futures = set()
+        self._read_data_queue = HandoffQueue(self.read_queue_length)
+
+        # boto3 clients (unlike sessions and resources) are thread safe, so
+        # all threads use this one. This also saves a TLS handshake per
+        # thread and the resource layer's overhead per request.
+        self._s3 = self._get_client()
+
+        # Each worker gets its own id for the thread status in self._local.
+        self._local = threading.local()
+        self.reader_thread_status = array.array('B', [STATUS_NOTHING] * simultaneous_reads)
+        self.writer_thread_status = array.array('B', [STATUS_NOTHING] * simultaneous_writes)
+        self._write_pool = ThreadPoolExecutor(
+                max_workers=simultaneous_writes,
+                initializer=self._init_worker,
+                initargs=(itertools.count(),),
+                )
+        self._read_pool = ThreadPoolExecutor(
+                max_workers=simultaneous_reads,
+                initializer=self._init_worker,
+                initargs=(itertools.count(),),
+                )
+
+        # Optionally drive reads and writes from one asyncio event loop
+        # instead of the thread pools.
+        self._loop = None
+        if config.getboolean('use_asyncio', False):
+            if aioboto3 is None:
+                logger.warning('use_asyncio is set, but aioboto3 is not installed. Using threads.')
+            else:
+                self._start_loop(simultaneous_reads, simultaneous_writes, multipart_concurrency)
 
 
     def _get_client(self):
@@ -140,109 +268,227 @@ class DataBackend(_DataBackend):
         return client
 
 
-    def _writer(self, id_):
-        """ A threaded background writer """
-        #bucket = None
-        client = None
-        while True:
-            self.writer_thread_status[id_] = STATUS_QUEUE
-            entry = self._write_queue.get()
-            self.writer_thread_status[id_] = STATUS_NOTHING
-            if entry is None or self.last_exception:
-                logger.debug("Writer {} finishing.".format(id_))
-                break
-            if client is None:
-                client = self._get_client()
-            uid, enc_envkey, enc_version, enc_nonce, data, callback = entry
+    def _init_worker(self, ids):
+        self._local.id = next(ids)
+
+
+    def _enqueue_write(self, entry, sync=False):
+        self._write_slots.acquire()
+        if self._loop:
+            future = asyncio.run_coroutine_threadsafe(self._do_write_async(entry), self._loop)
+        else:
+            future = self._write_pool.submit(self._do_write, entry)
+        self._write_futures.add(future)
+        future.add_done_callback(self._write_done)
+        if sync:
+            wait(list(self._write_futures) + [future])  # all pending writes
+            if self.last_exception:
+                raise self.last_exception
 
+
+    def _write_done(self, future):
+        self._write_futures.discard(future)
+        self._write_slots.release()
+
+
+    def _do_write(self, entry):
+        """ Runs in a writer thread of self._write_pool """
+        if self.last_exception:
+            return
+        id_ = self._local.id
+        uid, enc_envkey, enc_version, enc_nonce, data, callback = entry
+
+        if self.write_throttling.rate:  # 0 disables throttling
             self.writer_thread_status[id_] = STATUS_THROTTLING
             time.sleep(self.write_throttling.consume(len(data)))
             self.writer_thread_status[id_] = STATUS_NOTHING
 
-            try:
-                self.writer_thread_status[id_] = STATUS_WRITING
-                client.put_object(Body=data, Key=uid, Bucket=self._bucket_name)
-                #client.upload_fileobj(io.BytesIO(data), Key=uid, Bucket=self._bucket_name)
-                self.writer_thread_status[id_] = STATUS_NOTHING
-                #if random.random() > 0.9:
-                #    raise ValueError("This is a test")
-            except Exception as e:
-                self.last_exception = e
+        try:
+            self.writer_thread_status[id_] = STATUS_WRITING
+            if len(data) >= self.multipart_threshold:
+                self._put_multipart(uid, data)
             else:
-                if callback:
-                    callback(uid, enc_envkey, enc_version, enc_nonce)
-                self._write_queue.task_done()
+                self._s3.put_object(Body=data, Key=uid, Bucket=self._bucket_name)
+            #client.upload_fileobj(io.BytesIO(data), Key=uid, Bucket=self._bucket_name)
+            self.writer_thread_status[id_] = STATUS_NOTHING
+            #if random.random() > 0.9:
+            #    raise ValueError("This is a test")
+        except Exception as e:
+            self.writer_thread_status[id_] = STATUS_NOTHING
+            self.last_exception = e
+        else:
+            if callback:
+                callback(uid, enc_envkey, enc_version, enc_nonce)
 
 
-    def _reader(self, id_):
-        """ A threaded background reader """
-        bucket = None
-        while True:
-            block = self._read_queue.get()  # contains block
-            if block is None or self.last_exception:
-                logger.debug("Reader {} finishing.".format(id_))
-                break
-            if bucket is None:
-                bucket = self._get_bucket()
-            t1 = time.time()
-            try:
-                self.reader_thread_status[id_] = STATUS_READING
-                data = self.read_raw(block, bucket)
-                self.reader_thread_status[id_] = STATUS_NOTHING
-                #except FileNotFoundError:
-            except Exception as e:
-                self.last_exception = e
-            else:
-                self._read_data_queue.put((block, data))
-                t2 = time.time()
-                self._read_queue.task_done()
-                logger.debug('Reader {} read data async. uid {} in {:.2f}s (Queue size is {})'.format(id_, block.uid, t2-t1, self._read_queue.qsize()))
+    def _parts(self, size):
+        """ Returns (part_number, start, end) of the parts a multipart upload
+        of size bytes is split into. The parts grow beyond
+        self.multipart_chunksize if s3's part limit would be exceeded.
+        """
+        chunksize = max(self.multipart_chunksize, -(-size // self.MULTIPART_MAX_PARTS))
+        return [(part_number, start, min(start + chunksize, size))
+            for part_number, start in enumerate(range(0, size, chunksize), start=1)]
+
 
+    def _put_multipart(self, uid, data):
+        """ Uploads data in parts of self.multipart_chunksize in parallel """
+        upload_id = self._s3.create_multipart_upload(Bucket=self._bucket_name, Key=uid)['UploadId']
 
-    def read_raw(self, block, _bucket=None):
-        if not _bucket:
-            _bucket = self.bucket
+        view = memoryview(data)
 
+        def _upload_part(part_number, start, end):
+            response = self._s3.upload_part(
+                # stream the part from data instead of slicing a copy of it
+                Body=MemoryViewReader(view[start:end]),
+                Bucket=self._bucket_name,
+                Key=uid,
+                PartNumber=part_number,
+                UploadId=upload_id,
+            )
+            return {'ETag': response['ETag'], 'PartNumber': part_number}
+
+        futures = []
+        try:
+            for part_number, start, end in self._parts(len(data)):
+                futures.append(self._part_pool.submit(_upload_part, part_number, start, end))
+            parts = [f.result() for f in futures]  # ordered by PartNumber
+            self._s3.complete_multipart_upload(
+                Bucket=self._bucket_name,
+                Key=uid,
+                UploadId=upload_id,
+                MultipartUpload={'Parts': parts},
+            )
+        except Exception:
+            # let running parts finish before aborting, otherwise they would
+            # be stored (and billed) without ever being completed.
+            for f in futures:
+                f.cancel()
+            wait(futures)
+            self._s3.abort_multipart_upload(Bucket=self._bucket_name, Key=uid, UploadId=upload_id)
+            raise
+
+
+    def _enqueue_read(self, block):
+        if self._loop:
+            future = asyncio.run_coroutine_threadsafe(self._do_read_async(block), self._loop)
+        else:
+            future = self._read_pool.submit(self._do_read, block)
+        self._read_futures.add(future)
+        future.add_done_callback(self._read_futures.discard)
+
+
+    def _do_read(self, block):
+        """ Runs in a reader thread of self._read_pool """
+        if self.last_exception:
+            return
+        id_ = self._local.id
+        t1 = time.time()
+        try:
+            self.reader_thread_status[id_] = STATUS_READING
+            data = self.read_raw(block)
+            self.reader_thread_status[id_] = STATUS_NOTHING
+            #except FileNotFoundError:
+        except Exception as e:
+            self.reader_thread_status[id_] = STATUS_NOTHING
+            self.last_exception = e
+        else:
+            self._read_data_queue.put((block, data))
+            t2 = time.time()
+            logger.debug('Reader {} read data async. uid {} in {:.2f}s ({} reads pending)'.format(id_, block.uid, t2-t1, len(self._read_futures)))
+
+
+    def read_raw(self, block):
         while True:
-            obj = _bucket.Object(block.uid)
             try:
-                data_dict = obj.get()
-                data = data_dict['Body'].read()
-            except ClientError as e:
-                if e.response['Error']['Code'] == 'NoSuchKey' or e.response['Error']['Code'] == '404':
-                    raise FileNotFoundError('Key {} not found.'.format(block.uid)) from None
+                if block.size >= self.multipart_download_threshold:
+                    data = self._get_ranged(block.uid)
                 else:
-                    raise
-            except socket.timeout:
-                logger.error('Timeout while fetching from s3, trying again.')
-                pass
-            except OSError as e:
-                # TODO: This is new and currently untested code. I'm not sure
-                # why this happens in favour of socket.timeout and also if it
-                # might be better to abort the whole restore/backup/scrub if
-                # this happens, because I can't tell if the s3 lib is able to
-                # recover from this situation and continue or not. We will see
-                # this in the logs next time s3 is generating timeouts.
-                logger.error('Timeout while fetching from s3 - error is "{}", trying again.'.format(str(e)))
-                pass
+                    data_dict = self._s3.get_object(Bucket=self._bucket_name, Key=block.uid)
+                    data = data_dict['Body'].read()
+            except Exception as e:
+                self._retry_read(block, e)
             else:
                 break
-        time.sleep(self.read_throttling.consume(len(data)))  # TODO: Need throttling in thread statistics!
+        if self.read_throttling.rate:  # TODO: Need throttling in thread statistics!
+            time.sleep(self.read_throttling.consume(len(data)))
         return data
 
 
-    def rm(self, uid):
-        obj = self.bucket.Object(uid)
-        try:
-            obj.load()
-        except ClientError as e:
+    def _retry_read(self, block, e):
+        """ Returns if reading block should be retried after the exception e,
+        raises otherwise.
+        """
+        if isinstance(e, ClientError):
             if e.response['Error']['Code'] == 'NoSuchKey' or e.response['Error']['Code'] == '404':
-                #raise FileNotFoundError('Key {} not found.'.format(uid)) from None
-                logger.error('Unable to remove block: key {} not found.'.format(uid))
-            else:
-                raise
+                raise FileNotFoundError('Key {} not found.'.format(block.uid)) from None
+            raise e
+        elif isinstance(e, (socket.timeout, asyncio.TimeoutError)):
+            logger.error('Timeout while fetching from s3, trying again.')
+        elif isinstance(e, OSError):
+            # TODO: This is new and currently untested code. I'm not sure
+            # why this happens in favour of socket.timeout and also if it
+            # might be better to abort the whole restore/backup/scrub if
+            # this happens, because I can't tell if the s3 lib is able to
+            # recover from this situation and continue or not. We will see
+            # this in the logs next time s3 is generating timeouts.
+            logger.error('Timeout while fetching from s3 - error is "{}", trying again.'.format(str(e)))
         else:
-            obj.delete()
+            raise e
+
+
+    def _range(self, start):
+        """ The Range header of the download chunk starting at start """
+        return 'bytes={}-{}'.format(start, start + self.download_chunksize - 1)
+
+
+    def _range_starts(self, first):
+        """ Returns the starts of the ranges after the first one. The size of
+        the stored blob differs from block.size (compression, encryption),
+        so it's taken from the first range's Content-Range.
+        """
+        total = int(first['ContentRange'].rsplit('/', 1)[1])
+        return range(self.download_chunksize, total, self.download_chunksize)
+
+
+    def _get_ranged(self, uid):
+        """ Reads an object with parallel byte-range GETs of self.download_chunksize """
+        def _get_range(start):
+            return self._s3.get_object(Bucket=self._bucket_name, Key=uid, Range=self._range(start))
+
+        def _read_range(start):
+            return _get_range(start)['Body'].read()
+
+        first = _get_range(0)
+        futures = [self._part_pool.submit(_read_range, start) for start in self._range_starts(first)]
+        ranges = [first['Body'].read()] + [f.result() for f in futures]
+        return b''.join(ranges)
+
+
+    def rm(self, uid):
+        """ S3 deletes are idempotent, removing a missing key succeeds. """
+        self._s3.delete_object(Bucket=self._bucket_name, Key=uid)
+
+
+    def _delete_objects(self, uids):
+        """ Deletes up to 1000 uids in one request and returns the uids
+        that couldn't be deleted.
+        """
+        logger.debug("About to delete {} objects from the backend.".format(len(uids)))
+        response = self._s3.delete_objects(
+            Bucket=self._bucket_name,
+            Delete={
+                'Objects': [{'Key': uid} for uid in uids],
+                'Quiet': True,  # only report errors
+            },
+            RequestPayer='requester',
+        )
+        # {'Errors': [{'Key': 'a04ab9bcc0BK6vATCi95Bwb4Djriiy5B', 'Code': 'AccessDenied', ...}]}
+        errors = response.get('Errors', [])
+        for error in errors:
+            logger.debug("Unable to delete key {}: {}".format(error['Key'], error.get('Message', error.get('Code'))))
+        logger.debug("Deleted {} keys, {} could not be deleted.".format(len(uids) - len(errors), len(errors)))
+        return [error['Key'] for error in errors]
 
 
     def rm_many(self, uids):
@@ -250,31 +496,223 @@ class DataBackend(_DataBackend):
         of uids that couldn't be deleted.
         """
         # "The request contains a list of up to 1000 keys that you want to delete."
+        futures = [self._part_pool.submit(self._delete_objects, chunk) for chunk in chunks(uids, 1000)]
         no_deletes = []
-        for chunk in chunks(uids, 1000):
-            logger.debug("About to delete {} objects from the backend.".format(len(chunk)))
-            objects = [{'Key': uid} for uid in chunk]
-            response = self.bucket.delete_objects(
-                Delete={
-                    'Objects': objects,
-                    #'Quiet': True|False
-                },
-                RequestPayer='requester',
-            )
-            # {'Deleted': [{'Key': 'a04ab9bcc0BK6vATCi95Bwb4Djriiy5B'},
-
-            deleted_objects = [d['Key'] for d in response['Deleted']]
-            not_found_objects = set(chunk) - set(deleted_objects)
-            no_deletes.extend(not_found_objects)
-            logger.debug("Deleted {} keys, {} were not found.".format(len(deleted_objects), len(not_found_objects)))
+        for f in futures:
+            no_deletes.extend(f.result())
         return no_deletes
 
 
     def get_all_blob_uids(self, prefix=None):
-        if prefix is None:
-            objects_iterable = self.bucket.objects.all()
-        else:
-            objects_iterable = self.bucket.objects.filter(Prefix=prefix)
+        paginator = self._s3.get_paginator('list_objects')
+        pages = paginator.paginate(Bucket=self._bucket_name, Prefix=prefix or '')
+        return [o['Key'] for page in pages for o in page.get('Contents', [])]
+
+
+    def queue_status(self):
+        return {
+            'rq_filled': self._read_data_queue.qsize() / self._read_data_queue.maxsize,  # 0..1
+            'wq_filled': len(self._write_futures) / self.write_queue_length,
+        }
+
+
+    def thread_status(self):
+        readers = bytes(self.reader_thread_status)
+        writers = bytes(self.writer_thread_status)
+        return "DaBaR: N{} R{} T{} QL{}  DaBaW: N{} W{} T{} QL{}".format(
+                readers.count(STATUS_NOTHING),
+                readers.count(STATUS_READING),
+                readers.count(STATUS_THROTTLING),
+                len(self._read_futures),
+                writers.count(STATUS_NOTHING),
+                writers.count(STATUS_WRITING),
+                writers.count(STATUS_THROTTLING),
+                len(self._write_futures),
+                )
+
+
+    def _start_loop(self, simultaneous_reads, simultaneous_writes, multipart_concurrency):
+        """ Starts a thread running an asyncio event loop with one aioboto3
+        client. Blocks until the client is ready.
+        """
+        ready = threading.Event()
+        self._aio_s3 = None
+        self._loop_thread = threading.Thread(
+                target=asyncio.run,
+                args=(self._pump(ready, simultaneous_reads, simultaneous_writes, multipart_concurrency),),
+                )
+        self._loop_thread.daemon = True
+        self._loop_thread.start()
+        ready.wait()
+        if self._aio_s3 is None:
+            raise RuntimeError('Unable to create the aioboto3 s3 client.')
+
+
+    async def _pump(self, ready, simultaneous_reads, simultaneous_writes, multipart_concurrency):
+        """ Runs in the event loop thread until close() """
+        try:
+            self._stop = asyncio.Event()
+            # ids of the idle workers, see _worker()
+            self._read_ids = asyncio.Queue()
+            for id_ in range(simultaneous_reads):
+                self._read_ids.put_nowait(id_)
+            self._write_ids = asyncio.Queue()
+            for id_ in range(simultaneous_writes):
+                self._write_ids.put_nowait(id_)
+            self._part_limit = asyncio.Semaphore(multipart_concurrency)
+            session = aioboto3.Session()
+            async with session.client('s3', **self._resource_config) as s3:
+                self._aio_s3 = s3
+                self._loop = asyncio.get_running_loop()
+                ready.set()
+                await self._stop.wait()
+        finally:
+            ready.set()
+
+
+    @contextlib.asynccontextmanager
+    async def _worker(self, ids):
+        """ Takes a worker id from ids for the duration of the block. This
+        limits the number of concurrent reads or writes like the thread pools
+        do, and gives the coroutine its slot in the thread status.
+        """
+        id_ = await ids.get()
+        try:
+            yield id_
+        finally:
+            ids.put_nowait(id_)
+
+
+    async def _do_write_async(self, entry):
+        """ The event loop's counterpart of _do_write """
+        if self.last_exception:
+            return
+        uid, enc_envkey, enc_version, enc_nonce, data, callback = entry
+
+        async with self._worker(self._write_ids) as id_:
+            if self.write_throttling.rate:  # 0 disables throttling
+                self.writer_thread_status[id_] = STATUS_THROTTLING
+                await asyncio.sleep(self.write_throttling.consume(len(data)))
+            try:
+                self.writer_thread_status[id_] = STATUS_WRITING
+                if len(data) >= self.multipart_threshold:
+                    await self._put_multipart_async(uid, data)
+                else:
+                    await self._aio_s3.put_object(Body=data, Key=uid, Bucket=self._bucket_name)
+            except Exception as e:
+                self.last_exception = e
+            else:
+                if callback:
+                    callback(uid, enc_envkey, enc_version, enc_nonce)
+            finally:
+                self.writer_thread_status[id_] = STATUS_NOTHING
+
+
+    async def _put_multipart_async(self, uid, data):
+        """ The event loop's counterpart of _put_multipart """
+        upload_id = (await self._aio_s3.create_multipart_upload(Bucket=self._bucket_name, Key=uid))['UploadId']
+
+        view = memoryview(data)
+
+        async def _upload_part(part_number, start, end):
+            async with self._part_limit:
+                response = await self._aio_s3.upload_part(
+                    Body=MemoryViewReader(view[start:end]),
+                    Bucket=self._bucket_name,
+                    Key=uid,
+                    PartNumber=part_number,
+                    UploadId=upload_id,
+                )
+            return {'ETag': response['ETag'], 'PartNumber': part_number}
+
+        # wait for all parts, even if one fails, so that no part is stored
+        # after the upload has been aborted.
+        parts = await asyncio.gather(
+            *[_upload_part(part_number, start, end) for part_number, start, end in self._parts(len(data))],
+            return_exceptions=True,
+        )
+        try:
+            for part in parts:
+                if isinstance(part, BaseException):
+                    raise part
+            await self._aio_s3.complete_multipart_upload(
+                Bucket=self._bucket_name,
+                Key=uid,
+                UploadId=upload_id,
+                MultipartUpload={'Parts': parts},
+            )
+        except Exception:
+            await self._aio_s3.abort_multipart_upload(Bucket=self._bucket_name, Key=uid, UploadId=upload_id)
+            raise
+
+
+    async def _do_read_async(self, block):
+        """ The event loop's counterpart of _do_read """
+        if self.last_exception:
+            return
+        t1 = time.time()
+        # The slot is held until the data is queued, like a reader thread
+        # blocks in put(). Otherwise all pending reads would be fetched and
+        # pile up in memory when the consumer is slower than s3.
+        async with self._worker(self._read_ids) as id_:
+            try:
+                self.reader_thread_status[id_] = STATUS_READING
+                data = await self._read_raw_async(block)
+            except Exception as e:
+                self.last_exception = e
+                return
+            finally:
+                self.reader_thread_status[id_] = STATUS_NOTHING
+            # _read_data_queue.put blocks when the queue is full, which must
+            # not block the event loop.
+            await self._loop.run_in_executor(None, self._read_data_queue.put, (block, data))
+        t2 = time.time()
+        logger.debug('Event loop read data async. uid {} in {:.2f}s ({} reads pending)'.format(block.uid, t2-t1, len(self._read_futures)))
+
+
+    async def _read_raw_async(self, block):
+        """ The event loop's counterpart of read_raw """
+        while True:
+            try:
+                if block.size >= self.multipart_download_threshold:
+                    data = await self._get_ranged_async(block.uid)
+                else:
+                    response = await self._aio_s3.get_object(Bucket=self._bucket_name, Key=block.uid)
+                    data = await response['Body'].read()
+            except Exception as e:
+                self._retry_read(block, e)
+            else:
+                break
+        if self.read_throttling.rate:
+            await asyncio.sleep(self.read_throttling.consume(len(data)))
+        return data
+
 
-        return [o.key for o in objects_iterable]
+    async def _get_ranged_async(self, uid):
+        """ The event loop's counterpart of _get_ranged """
+        async def _get_range(start):
+            return await self._aio_s3.get_object(Bucket=self._bucket_name, Key=uid, Range=self._range(start))
+
+        async def _read_range(start):
+            async with self._part_limit:
+                response = await _get_range(start)
+                return await response['Body'].read()
+
+        async with self._part_limit:
+            first = await _get_range(0)
+            first_range = await first['Body'].read()
+        ranges = await asyncio.gather(*[_read_range(start) for start in self._range_starts(first)])
+        return b''.join([first_range] + ranges)
+
+
+    def close(self):
+        if self._loop:
+            # wait for pending jobs, then stop the loop and its client
+            wait(list(self._write_futures) + list(self._read_futures))
+            self._loop.call_soon_threadsafe(self._stop.set)
+            self._loop_thread.join()
+            self._loop = None  # asyncio.run() has closed it, close() may be called again
+        self._write_pool.shutdown()
+        self._read_pool.shutdown()
+        self._part_pool.shutdown()
 
@@ -3,7 +3,12 @@
 
 from backy2.logging import logger
 from backy2.io import IO as _IO
+from backy2.utils import HandoffQueue
 from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+import array
+import itertools
+import mmap
 import os
 import queue
 import re
@@ -13,7 +18,6 @@ import time
 STATUS_NOTHING = 0
 STATUS_READING = 1
 STATUS_WRITING = 2
-STATUS_SEEKING = 3
 STATUS_FADVISE = 4
 
 if hasattr(os, 'posix_fadvise'):
@@ -28,26 +32,126 @@ else:  # pragma: no cover
     def posix_fadvise(*args, **kw):
         return
 
+if hasattr(os, 'pwritev'):
+    pwritev = os.pwritev
+else:  # pragma: no cover
+    def pwritev(fd, buffers, offset):
+        written = 0
+        for buffer in buffers:
+            written += os.pwrite(fd, buffer, offset + written)
+        return written
+
+
+def pwritev_all(fd, buffers, offset):
+    """ Like pwritev, but continues after short writes until all buffers have
+    been written. Returns the number of bytes written.
+    """
+    buffers = list(buffers)
+    written = 0
+    while buffers:
+        n = pwritev(fd, buffers, offset + written)
+        if n == 0:
+            raise OSError('Unable to write at offset {}.'.format(offset + written))
+        written += n
+        # drop the buffers which have been written completely
+        while buffers and n >= len(buffers[0]):
+            n -= len(buffers[0])
+            buffers.pop(0)
+        if n:
+            buffers[0] = memoryview(buffers[0])[n:]
+    return written
+
+
+class DontneedRange():
+    """ Collects the file range a thread has read or written so that it can
+    be dropped from the page cache with one posix_fadvise call per
+    `length` bytes instead of one per block.
+    """
+    def __init__(self, fd, length):
+        self.fd = fd
+        self.length = length
+        self.start = None
+        self.end = 0
+        self.collected = 0
+
+
+    def add(self, offset, length):
+        """ Returns True when enough has been collected to flush. """
+        self.start = offset if self.start is None else min(self.start, offset)
+        self.end = max(self.end, offset + length)
+        self.collected += length
+        return self.collected >= self.length
+
+
+    def flush(self):
+        if self.start is not None:
+            posix_fadvise(self.fd, self.start, self.end - self.start, os.POSIX_FADV_DONTNEED)
+        self.start = None
+        self.end = 0
+        self.collected = 0
+
+
+class DontneedPrefix(DontneedRange):
+    """ A DontneedRange shared by all readers. Readers complete blocks out of
+    order, so only the blocks up to the first one which is still being read
+    (in the order they were queued) are collected. Blocks other readers are
+    about to read, which the kernel may have read ahead, stay cached.
+    """
+    def __init__(self, fd, length):
+        super().__init__(fd, length)
+        self._lock = threading.Lock()
+        self._completed = {}  # seq: (offset, length) of reads completed after the prefix
+        self._next_seq = 0
+
+
+    def complete(self, seq, offset=None, length=0):
+        """ Marks read number seq as completed, offset None if nothing has
+        been read. Returns True when enough has been collected to flush.
+        """
+        with self._lock:
+            self._completed[seq] = (offset, length)
+            while self._next_seq in self._completed:
+                offset, length = self._completed.pop(self._next_seq)
+                self._next_seq += 1
+                if offset is not None:
+                    self.add(offset, length)
+            return self.collected >= self.length
+
+
+    def flush(self):
+        with self._lock:
+            super().flush()
+
 
 class IO(_IO):
     mode = None
     WRITE_QUEUE_LENGTH = 20
     READ_QUEUE_LENGTH = 20
+    WRITE_RUN_LENGTH = 64  # max. number of consecutive blocks written at once
+    FADVISE_BLOCKS = 64  # drop the page cache once per this many blocks
+    DIRECT_IO_ALIGNMENT = 4096  # offsets and lengths of O_DIRECT writes
+    DIRECT_IO_BUFFER_SIZE = 4 * 1024 * 1024  # aligned buffer per writer, a multiple of DIRECT_IO_ALIGNMENT
 
     def __init__(self, config, block_size, hash_function):
         self.simultaneous_reads = config.getint('simultaneous_reads', 1)
         self.simultaneous_writes = config.getint('simultaneous_reads', 1)
+        self.fadvise_blocks = config.getint('fadvise_blocks', self.FADVISE_BLOCKS)
+        self.direct_io = config.getboolean('direct_io', True)
         self.block_size = block_size
         self.hash_function = hash_function
 
         self._reader_threads = []
         self._writer_threads = []
+        # hashlib releases the GIL while hashing, so checksums are computed
+        # in parallel to the readers' next preads.
+        self._hasher_pool = ThreadPoolExecutor(max_workers=self.simultaneous_reads)
 
-        self.reader_thread_status = {}
-        self.writer_thread_status = {}
+        # one byte per thread, indexed by the thread's id
+        self.reader_thread_status = array.array('B', [STATUS_NOTHING] * self.simultaneous_reads)
+        self.writer_thread_status = array.array('B', [STATUS_NOTHING] * self.simultaneous_writes)
 
         self._inqueue = queue.Queue()  # infinite size for all the blocks
-        self._outqueue = queue.Queue(self.simultaneous_reads + self.READ_QUEUE_LENGTH)  # data of read blocks
+        self._outqueue = HandoffQueue(self.simultaneous_reads + self.READ_QUEUE_LENGTH)  # data of read blocks
         self._write_queue = queue.Queue(self.simultaneous_writes + self.WRITE_QUEUE_LENGTH)  # blocks to be written
 
 
@@ -57,13 +161,17 @@ class IO(_IO):
         if not _s:
             raise RuntimeError('Not a valid io name: {} . Need a file path, e.g. file:///somepath/file'.format(io_name))
         self.io_name = _s.groups()[0]
+        # shared by all readers, os.pread doesn't move the file position
+        self._read_fd = os.open(self.io_name, os.O_RDONLY)
+        posix_fadvise(self._read_fd, 0, 0, os.POSIX_FADV_SEQUENTIAL)
+        self._read_seq = itertools.count()  # numbers the reads in queue order
+        self._dontneed = DontneedPrefix(self._read_fd, self.fadvise_blocks * self.block_size)
 
         for i in range(self.simultaneous_reads):
             _reader_thread = threading.Thread(target=self._reader, args=(i,))
             _reader_thread.daemon = True
             _reader_thread.start()
             self._reader_threads.append(_reader_thread)
-            self.reader_thread_status[i] = STATUS_NOTHING
 
 
     def open_w(self, io_name, size=None, force=False):
@@ -88,12 +196,19 @@ class IO(_IO):
                 f.seek(size - 1)
                 f.write(b'\0')
 
+        if self.direct_io and not hasattr(os, 'O_DIRECT'):
+            logger.warn('Running without O_DIRECT, restores go through the page cache.')
+            self.direct_io = False
+        if self.direct_io and self.block_size % self.DIRECT_IO_ALIGNMENT != 0:
+            logger.warn('Block size {} is not a multiple of {}, restores go through the page cache.'.format(
+                self.block_size, self.DIRECT_IO_ALIGNMENT))
+            self.direct_io = False
+
         for i in range(self.simultaneous_writes):
             _writer_thread = threading.Thread(target=self._writer, args=(i,))
             _writer_thread.daemon = True
             _writer_thread.start()
             self._writer_threads.append(_writer_thread)
-            self.writer_thread_status[i] = STATUS_NOTHING
 
 
     def size(self):
@@ -109,72 +224,139 @@ class IO(_IO):
 
     def _writer(self, id_):
         """ self._write_queue contains a list of (Block, data) to be written.
+        Queued blocks with consecutive ids are written in one pwritev call.
+        With direct_io, aligned runs are copied into a page aligned buffer
+        piece by piece and written with O_DIRECT, everything else goes through
+        the page cache.
         """
-        with open(self.io_name, 'rb+') as _write_file:
+        fd = os.open(self.io_name, os.O_RDWR)
+        dontneed = DontneedRange(fd, self.fadvise_blocks * self.block_size)
+        direct_fd = None
+        if self.direct_io:
+            try:
+                direct_fd = os.open(self.io_name, os.O_WRONLY | os.O_DIRECT)
+            except OSError as e:
+                # e.g. tmpfs doesn't support O_DIRECT
+                logger.debug('IO writer {} can\'t use O_DIRECT: {}'.format(id_, e))
+            else:
+                # anonymous mmaps are page aligned
+                direct_buffer = mmap.mmap(-1, self.DIRECT_IO_BUFFER_SIZE)
+                direct_view = memoryview(direct_buffer)
+        pending = []  # an entry taken from the queue which didn't fit the last run
+        try:
             while True:
-                entry = self._write_queue.get()
+                entry = pending.pop() if pending else self._write_queue.get()
                 if entry is None:
                     logger.debug("IO writer {} finishing.".format(id_))
                     self._write_queue.task_done()
                     break
-                block, data, callback = entry
-
-                offset = block.id * self.block_size
 
-                self.writer_thread_status[id_] = STATUS_SEEKING
-                _write_file.seek(offset)
+                run = [entry]
+                while len(run) < self.WRITE_RUN_LENGTH and len(run[-1][1]) == self.block_size:
+                    try:
+                        entry = self._write_queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if entry is not None and entry[0].id == run[-1][0].id + 1:
+                        run.append(entry)
+                    else:
+                        pending.append(entry)
+                        break
+
+                offset = run[0][0].id * self.block_size
+                buffers = [data for block, data, callback in run]
+                length = sum(len(data) for data in buffers)
                 self.writer_thread_status[id_] = STATUS_WRITING
-                written = _write_file.write(data)
-                posix_fadvise(_write_file.fileno(), offset, offset + written, os.POSIX_FADV_DONTNEED)
+                if direct_fd is not None and length % self.DIRECT_IO_ALIGNMENT == 0:
+                    written = 0
+                    filled = 0
+                    for data in buffers:
+                        data = memoryview(data)
+                        while data:
+                            n = min(len(data), len(direct_view) - filled)
+                            direct_view[filled:filled + n] = data[:n]
+                            filled += n
+                            data = data[n:]
+                            if filled == len(direct_view):
+                                written += self._pwrite_direct(direct_fd, fd, direct_view, offset + written)
+                                filled = 0
+                    if filled:
+                        # aligned, as length and the buffer size are
+                        written += self._pwrite_direct(direct_fd, fd, direct_view[:filled], offset + written)
+                else:
+                    written = pwritev_all(fd, buffers, offset)
+                    if dontneed.add(offset, written):
+                        self.writer_thread_status[id_] = STATUS_FADVISE
+                        dontneed.flush()
                 self.writer_thread_status[id_] = STATUS_NOTHING
-                assert written == len(data)
-                if callback:
-                    callback()
 
-                self._write_queue.task_done()
+                for block, data, callback in run:
+                    if callback:
+                        callback()
+                    self._write_queue.task_done()
+        finally:
+            dontneed.flush()
+            os.close(fd)
+            if direct_fd is not None:
+                # direct_buffer is freed with the thread, closing it here
+                # would fail while an exception still references a slice.
+                os.close(direct_fd)
+
+
+    def _pwrite_direct(self, direct_fd, fd, view, offset):
+        """ Writes all of view, a slice of the aligned buffer, with O_DIRECT
+        and returns its length.
+        """
+        written = 0
+        while written < len(view):
+            if written % self.DIRECT_IO_ALIGNMENT:
+                # O_DIRECT can't continue after an unaligned short write
+                written += pwritev_all(fd, [view[written:]], offset + written)
+            else:
+                n = os.pwrite(direct_fd, view[written:], offset + written)
+                if n == 0:
+                    raise OSError('Unable to write at offset {}.'.format(offset + written))
+                written += n
+        return written
 
 
     def _reader(self, id_):
         """ self._inqueue contains block_ids to be read.
-        self._outqueue contains (block_id, data, data_checksum)
+        self._outqueue contains (block_id, data, data_checksum future, metadata)
         """
-        with open(self.io_name, 'rb') as source_file:
-            while True:
-                entry = self._inqueue.get()
-                if entry is None:
-                    logger.debug("IO {} finishing.".format(id_))
-                    self._outqueue.put(None)  # also let the outqueue end
-                    self._inqueue.task_done()
-                    break
-                block_id, read, metadata = entry
-                if not read:
-                    self._outqueue.put((block_id, None, None, metadata))
-                else:
-                    offset = block_id * self.block_size
-                    t1 = time.time()
-                    self.reader_thread_status[id_] = STATUS_SEEKING
-                    source_file.seek(offset)
-                    t2 = time.time()
-                    self.reader_thread_status[id_] = STATUS_READING
-                    data = source_file.read(self.block_size)
-                    t3 = time.time()
-                    # throw away cache
+        while True:
+            entry = self._inqueue.get()
+            if entry is None:
+                logger.debug("IO {} finishing.".format(id_))
+                self._outqueue.put(None)  # also let the outqueue end
+                self._inqueue.task_done()
+                break
+            seq, block_id, read, metadata = entry
+            if not read:
+                self._dontneed.complete(seq)
+                self._outqueue.put((block_id, None, None, metadata))
+            else:
+                offset = block_id * self.block_size
+                self.reader_thread_status[id_] = STATUS_READING
+                data = os.pread(self._read_fd, self.block_size, offset)
+                if not data:
+                    raise RuntimeError('EOF reached on source when there should be data.')
+                # throw away cache
+                if self._dontneed.complete(seq, offset, len(data)):
                     self.reader_thread_status[id_] = STATUS_FADVISE
-                    posix_fadvise(source_file.fileno(), offset, offset + self.block_size, os.POSIX_FADV_DONTNEED)
-                    self.reader_thread_status[id_] = STATUS_NOTHING
-                    if not data:
-                        raise RuntimeError('EOF reached on source when there should be data.')
+                    self._dontneed.flush()
+                self.reader_thread_status[id_] = STATUS_NOTHING
 
-                    data_checksum = self.hash_function(data).hexdigest()
+                hash_future = self._hasher_pool.submit(self.hash_function, data)
 
-                    self._outqueue.put((block_id, data, data_checksum, metadata))
-                self._inqueue.task_done()
+                self._outqueue.put((block_id, data, hash_future, metadata))
+            self._inqueue.task_done()
 
 
     def read(self, block_id, sync=False, read=True, metadata=None):
         """ Adds a read job, passes through metadata.
         read False means the real data will not be read."""
-        self._inqueue.put((block_id, read, metadata))
+        self._inqueue.put((next(self._read_seq), block_id, read, metadata))
         if sync:
             rblock_id, data, data_checksum, metadata = self.get()
             if rblock_id != block_id:
@@ -183,9 +365,12 @@ class IO(_IO):
 
 
     def get(self):
-        d = self._outqueue.get()
-        self._outqueue.task_done()
-        return d
+        entry = self._outqueue.get()
+        if entry is None:
+            return None
+        block_id, data, hash_future, metadata = entry
+        data_checksum = hash_future.result().hexdigest() if hash_future is not None else None
+        return block_id, data, data_checksum, metadata
 
 
     def write(self, block, data, callback=None):
@@ -201,17 +386,17 @@ class IO(_IO):
 
 
     def thread_status(self):
-        return "IOR: N{} R{} S{} F{} IQ{} OQ{}  IOW: N{} W{} S{} F{} QL{}".format(
-                len([t for t in self.reader_thread_status.values() if t==STATUS_NOTHING]),
-                len([t for t in self.reader_thread_status.values() if t==STATUS_READING]),
-                len([t for t in self.reader_thread_status.values() if t==STATUS_SEEKING]),
-                len([t for t in self.reader_thread_status.values() if t==STATUS_FADVISE]),
+        readers = bytes(self.reader_thread_status)
+        writers = bytes(self.writer_thread_status)
+        return "IOR: N{} R{} F{} IQ{} OQ{}  IOW: N{} W{} F{} QL{}".format(
+                readers.count(STATUS_NOTHING),
+                readers.count(STATUS_READING),
+                readers.count(STATUS_FADVISE),
                 self._inqueue.qsize(),
                 self._outqueue.qsize(),
-                len([t for t in self.writer_thread_status.values() if t==STATUS_NOTHING]),
-                len([t for t in self.writer_thread_status.values() if t==STATUS_WRITING]),
-                len([t for t in self.writer_thread_status.values() if t==STATUS_SEEKING]),
-                len([t for t in self.writer_thread_status.values() if t==STATUS_FADVISE]),
+                writers.count(STATUS_NOTHING),
+                writers.count(STATUS_WRITING),
+                writers.count(STATUS_FADVISE),
                 self._write_queue.qsize(),
                 )
 
@@ -222,6 +407,9 @@ class IO(_IO):
                 self._inqueue.put(None)  # ends the threads
             for _reader_thread in self._reader_threads:
                 _reader_thread.join()
+            self._dontneed.flush()
+            os.close(self._read_fd)
+            self._hasher_pool.shutdown()
         elif self.mode == 'w':
             t1 = time.time()
             for _writer_thread in self._writer_threads:
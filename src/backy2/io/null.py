@@ -4,6 +4,7 @@
 from backy2.logging import logger
 from backy2.io import IO as _IO
 from backy2.utils import generate_block
+import array
 import os
 import queue
 import re
@@ -39,8 +40,9 @@ class IO(_IO):
         self._inqueue = queue.Queue()  # infinite size for all the blocks
         self._outqueue = queue.Queue(self.simultaneous_reads + self.READ_QUEUE_LENGTH)  # data of read blocks
         self._write_queue = queue.Queue(self.simultaneous_writes + self.WRITE_QUEUE_LENGTH)  # blocks to be written
-        self.reader_thread_status = {}
-        self.writer_thread_status = {}
+        # one byte per thread, indexed by the thread's id
+        self.reader_thread_status = array.array('B', [STATUS_NOTHING] * self.simultaneous_reads)
+        self.writer_thread_status = array.array('B', [STATUS_NOTHING] * self.simultaneous_writes)
 
 
     def open_r(self, size_str):
@@ -70,7 +72,6 @@ class IO(_IO):
             _reader_thread.daemon = True
             _reader_thread.start()
             self._reader_threads.append(_reader_thread)
-            self.reader_thread_status[i] = STATUS_NOTHING
 
 
     def open_w(self, io_name, size=None, force=False):
@@ -83,7 +84,6 @@ class IO(_IO):
             _writer_thread.daemon = True
             _writer_thread.start()
             self._writer_threads.append(_writer_thread)
-            self.writer_thread_status[i] = STATUS_NOTHING
 
 
     def size(self):
@@ -128,9 +128,9 @@ class IO(_IO):
                 start_offset = block_id * self.block_size
                 end_offset = min(block_id * self.block_size + self.block_size, self._size)
                 block_size = end_offset - start_offset
-                self.writer_thread_status[id_] = STATUS_READING
+                self.reader_thread_status[id_] = STATUS_READING
                 data = generate_block(block_id, block_size)
-                self.writer_thread_status[id_] = STATUS_NOTHING
+                self.reader_thread_status[id_] = STATUS_NOTHING
 
                 if not data:
                     raise RuntimeError('EOF reached on source when there should be data.')
@@ -169,13 +169,15 @@ class IO(_IO):
 
 
     def thread_status(self):
+        readers = bytes(self.reader_thread_status)
+        writers = bytes(self.writer_thread_status)
         return "IOR: N{} R{} IQ{} OQ{}  IOW: N{} W{} QL{}".format(
-                len([t for t in self.reader_thread_status.values() if t==STATUS_NOTHING]),
-                len([t for t in self.reader_thread_status.values() if t==STATUS_READING]),
+                readers.count(STATUS_NOTHING),
+                readers.count(STATUS_READING),
                 self._inqueue.qsize(),
                 self._outqueue.qsize(),
-                len([t for t in self.writer_thread_status.values() if t==STATUS_NOTHING]),
-                len([t for t in self.writer_thread_status.values() if t==STATUS_WRITING]),
+                writers.count(STATUS_NOTHING),
+                writers.count(STATUS_WRITING),
                 self._write_queue.qsize(),
                 )
 
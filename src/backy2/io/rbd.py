@@ -14,6 +14,7 @@ from backy2.logging import logger
 from backy2.io import IO as _IO
 from functools import reduce
 from operator import or_
+import array
 import queue
 import re
 import threading
@@ -49,8 +50,9 @@ class IO(_IO):
         self._reader_threads = []
         self._writer_threads = []
 
-        self.reader_thread_status = {}
-        self.writer_thread_status = {}
+        # one byte per thread, indexed by the thread's id
+        self.reader_thread_status = array.array('B', [STATUS_NOTHING] * self.simultaneous_reads)
+        self.writer_thread_status = array.array('B', [STATUS_NOTHING] * self.simultaneous_writes)
         self._write_queue = queue.Queue(self.simultaneous_writes + self.WRITE_QUEUE_LENGTH)  # blocks to be written
         self._inqueue = queue.Queue()  # infinite size for all the blocks
         self._outqueue = queue.Queue(self.simultaneous_reads)
@@ -82,7 +84,6 @@ class IO(_IO):
             _reader_thread.daemon = True
             _reader_thread.start()
             self._reader_threads.append(_reader_thread)
-            self.reader_thread_status[i] = STATUS_NOTHING
 
 
     def open_w(self, io_name, size=None, force=False):
@@ -120,7 +121,6 @@ class IO(_IO):
             _writer_thread.daemon = True
             _writer_thread.start()
             self._writer_threads.append(_writer_thread)
-            self.writer_thread_status[i] = STATUS_NOTHING
 
         ioctx = self.cluster.open_ioctx(self.pool_name)
         self._write_rbd = rbd.Image(ioctx, self.image_name)
@@ -216,11 +216,13 @@ class IO(_IO):
 
 
     def thread_status(self):
+        readers = bytes(self.reader_thread_status)
+        writers = bytes(self.writer_thread_status)
         return "IOR: N{} R{}  IOW: N{} W{} QL{}".format(
-                len([t for t in self.reader_thread_status.values() if t==STATUS_NOTHING]),
-                len([t for t in self.reader_thread_status.values() if t==STATUS_READING]),
-                len([t for t in self.writer_thread_status.values() if t==STATUS_NOTHING]),
-                len([t for t in self.writer_thread_status.values() if t==STATUS_WRITING]),
+                readers.count(STATUS_NOTHING),
+                readers.count(STATUS_READING),
+                writers.count(STATUS_NOTHING),
+                writers.count(STATUS_WRITING),
                 self._write_queue.qsize(),
                 )
 
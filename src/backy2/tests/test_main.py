@@ -2,13 +2,19 @@ import pytest
 import os
 import sys
 import backy2.backy
+import backy2.config
+import backy2.io.file
+import hashlib
 import shutil
 #import time
 import random
 import uuid
+from collections import namedtuple
 
 BLOCK_SIZE = 1024*4096
 
+IOBlock = namedtuple('IOBlock', ['id'])
+
 @pytest.yield_fixture
 def argv():
     original = sys.argv
@@ -108,6 +114,78 @@ def test_FileBackend_save_read(test_path):
     backend.close()
 
 
+def _io_file_write(test_path, direct_io):
+    """ Writes 10 blocks and a short last block out of order, returns the
+    expected and the written file content. """
+    block_size = 4096
+    config = backy2.config.Config(
+        cfg='[io_file]\nsimultaneous_reads: 2\ndirect_io: {}\n'.format(direct_io),
+        section='io_file')
+    io = backy2.io.file.IO(config, block_size, hashlib.sha512)
+    path = os.path.join(test_path, 'restore')
+    blocks = {id: os.urandom(block_size) for id in range(10)}
+    blocks[10] = os.urandom(100)
+    io.open_w('file://' + path, 10 * block_size + 100)
+    written = []
+    for id in [3, 4, 5, 0, 1, 2, 7, 9, 8, 10, 6]:
+        io.write(IOBlock(id), blocks[id], callback=lambda id=id: written.append(id))
+    io.close()
+    assert sorted(written) == list(range(11))
+    with open(path, 'rb') as f:
+        return b''.join(blocks[id] for id in range(11)), f.read()
+
+
+@pytest.mark.parametrize('direct_io', [True, False])
+def test_io_file_write(test_path, direct_io):
+    expected, data = _io_file_write(test_path, direct_io)
+    assert data == expected
+
+
+def test_io_file_write_short_pwritev(test_path, monkeypatch):
+    # pwritev may write less than requested
+    def short_pwritev(fd, buffers, offset):
+        return os.pwrite(fd, bytes(buffers[0])[:1000], offset)
+    monkeypatch.setattr(backy2.io.file, 'pwritev', short_pwritev)
+    expected, data = _io_file_write(test_path, False)
+    assert data == expected
+
+
+@pytest.mark.parametrize('max_write', [4096, 1000])
+def test_io_file_write_short_direct_pwrite(test_path, monkeypatch, max_write):
+    # aligned and unaligned short O_DIRECT writes
+    pwrite = os.pwrite
+    def short_pwrite(fd, data, offset):
+        return min(pwrite(fd, data[:4096], offset), max_write)
+    monkeypatch.setattr(os, 'pwrite', short_pwrite)
+    expected, data = _io_file_write(test_path, True)
+    assert data == expected
+
+
+def test_io_file_write_small_direct_buffer(test_path, monkeypatch):
+    # runs of consecutive blocks are written in pieces of the aligned buffer
+    monkeypatch.setattr(backy2.io.file.IO, 'DIRECT_IO_BUFFER_SIZE', 2 * 4096)
+    expected, data = _io_file_write(test_path, True)
+    assert data == expected
+
+
+def test_io_file_dontneed_prefix(monkeypatch):
+    calls = []
+    monkeypatch.setattr(backy2.io.file, 'posix_fadvise', lambda fd, offset, length, advice: calls.append((offset, length)))
+    dontneed = backy2.io.file.DontneedPrefix(3, 2 * 4096)
+    # read 1 completes before read 0, nothing may be dropped yet
+    assert not dontneed.complete(1, 4096, 4096)
+    assert dontneed.complete(0, 0, 4096)
+    dontneed.flush()
+    assert calls == [(0, 2 * 4096)]
+    # read 3 completes before read 2, which reads nothing (offset None)
+    assert not dontneed.complete(3, 3 * 4096, 4096)
+    dontneed.flush()
+    assert calls == [(0, 2 * 4096)]
+    assert not dontneed.complete(2)
+    dontneed.flush()
+    assert calls == [(0, 2 * 4096), (3 * 4096, 4096)]
+
+
 def test_metabackend_set_version(test_path):
     backend = backy2.backy.SQLBackend('sqlite:///'+test_path+'/backy.sqlite')
     name = 'backup-mysystem1-20150110140015'
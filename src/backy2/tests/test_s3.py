@@ -0,0 +1,253 @@
+import pytest
+import asyncio
+import http.client
+import io
+import os
+from collections import namedtuple
+from concurrent.futures import wait
+
+pytest.importorskip('boto3')
+
+import backy2.config
+import urllib3.connection
+from backy2.data_backends import s3
+from botocore.response import StreamingBody
+from botocore.stub import ANY, Stubber
+
+MiB = 1024 * 1024
+
+
+def _backend(**options):
+    config = """
+[DataBackend]
+aws_access_key_id: key
+aws_secret_access_key: secret
+region_name: us-east-1
+bucket_name: backy2
+multipart_concurrency: 1
+"""
+    config += ''.join('{}: {}\n'.format(option, value) for option, value in options.items())
+    return s3.DataBackend(backy2.config.Config(cfg=config, section='DataBackend'), b'', 0)
+
+
+@pytest.fixture
+def http_defaults():
+    """ set_http_blocksize (also called by every DataBackend) changes process
+    wide defaults, they are restored after the test. """
+    saved = []
+    for connection_class in set(s3._subclasses(http.client.HTTPConnection)):
+        init = connection_class.__dict__.get('__init__')
+        if init is not None:
+            kwdefaults = dict(init.__kwdefaults__) if init.__kwdefaults__ is not None else None
+            saved.append((init, init.__defaults__, kwdefaults))
+    yield
+    for init, defaults, kwdefaults in saved:
+        init.__defaults__ = defaults
+        init.__kwdefaults__ = kwdefaults
+
+
+@pytest.fixture
+def backend(http_defaults):
+    backend = _backend(multipart_chunksize=5 * MiB, download_chunksize=4)
+    yield backend
+    backend.close()
+
+
+def test_set_http_blocksize(http_defaults):
+    s3.set_http_blocksize(1024*1024)
+    assert http.client.HTTPConnection('localhost').blocksize == 1024*1024
+    assert http.client.HTTPSConnection('localhost').blocksize == 1024*1024
+    assert urllib3.connection.HTTPConnection('localhost').blocksize == 1024*1024
+    assert urllib3.connection.HTTPSConnection('localhost').blocksize == 1024*1024
+
+
+def test_put_multipart(backend):
+    bodies = []
+    def capture(params, **kwargs):
+        bodies.append(bytes(params['Body'].read()))
+        params['Body'].seek(0)
+    backend._s3.meta.events.register('provide-client-params.s3.UploadPart', capture)
+    with Stubber(backend._s3) as stubber:
+        stubber.add_response('create_multipart_upload', {'UploadId': 'up'}, {'Bucket': 'backy2', 'Key': 'uid'})
+        for part_number in (1, 2, 3):
+            stubber.add_response('upload_part', {'ETag': 'e{}'.format(part_number)}, {
+                'Body': ANY, 'Bucket': 'backy2', 'Key': 'uid', 'PartNumber': part_number, 'UploadId': 'up'})
+        stubber.add_response('complete_multipart_upload', {}, {
+            'Bucket': 'backy2', 'Key': 'uid', 'UploadId': 'up',
+            'MultipartUpload': {'Parts': [
+                {'ETag': 'e1', 'PartNumber': 1},
+                {'ETag': 'e2', 'PartNumber': 2},
+                {'ETag': 'e3', 'PartNumber': 3},
+            ]}})
+        data = os.urandom(10 * MiB + 10)
+        backend._put_multipart('uid', data)
+        stubber.assert_no_pending_responses()
+    assert bodies == [data[:5 * MiB], data[5 * MiB:10 * MiB], data[10 * MiB:]]
+
+
+def test_put_multipart_aborts(backend):
+    with Stubber(backend._s3) as stubber:
+        stubber.add_response('create_multipart_upload', {'UploadId': 'up'})
+        stubber.add_response('upload_part', {'ETag': 'e1'})
+        stubber.add_client_error('upload_part', 'InternalError')
+        stubber.add_response('abort_multipart_upload', {}, {'Bucket': 'backy2', 'Key': 'uid', 'UploadId': 'up'})
+        with pytest.raises(s3.ClientError):
+            backend._put_multipart('uid', bytes(10 * MiB))
+        stubber.assert_no_pending_responses()
+
+
+def test_get_ranged(backend):
+    def range_response(data, start, total):
+        return {
+            'Body': StreamingBody(io.BytesIO(data), len(data)),
+            'ContentLength': len(data),
+            'ContentRange': 'bytes {}-{}/{}'.format(start, start + len(data) - 1, total),
+        }
+    with Stubber(backend._s3) as stubber:
+        for start, data in ((0, b'0123'), (4, b'4567'), (8, b'89')):
+            stubber.add_response('get_object', range_response(data, start, 10), {
+                'Bucket': 'backy2', 'Key': 'uid', 'Range': 'bytes={}-{}'.format(start, start + 3)})
+        assert backend._get_ranged('uid') == b'0123456789'
+        stubber.assert_no_pending_responses()
+
+
+def test_multipart_chunksize_minimum(http_defaults):
+    backend = _backend(multipart_chunksize=1024)
+    assert backend.multipart_chunksize == 5 * MiB
+    backend.close()
+
+
+def test_parts_limit(backend):
+    size = 10000 * 5 * MiB + 1
+    parts = backend._parts(size)
+    assert len(parts) <= 10000
+    assert parts[0][:2] == (1, 0)
+    assert parts[-1][2] == size
+    assert all(end == next_start for (_, _, end), (_, next_start, _) in zip(parts, parts[1:]))
+
+
+Block = namedtuple('Block', ['id', 'uid', 'size', 'enc_version', 'enc_envkey'])
+
+
+class FakeAioBody():
+    def __init__(self, data):
+        self._data = data
+
+    async def read(self):
+        return self._data
+
+
+class FakeAioS3():
+    """ An in memory s3 with the async methods of an aioboto3 client """
+    def __init__(self):
+        self.objects = {}
+        self.parts = {}
+        self.get_timeouts = 0
+        self.on_request = None
+
+    def _request(self):
+        if self.on_request:
+            self.on_request()
+
+    async def put_object(self, Body, Key, Bucket):
+        self._request()
+        self.objects[Key] = bytes(Body)
+
+    async def get_object(self, Bucket, Key, Range=None):
+        self._request()
+        if self.get_timeouts:
+            self.get_timeouts -= 1
+            raise asyncio.TimeoutError()
+        if Key not in self.objects:
+            raise s3.ClientError({'Error': {'Code': 'NoSuchKey'}}, 'GetObject')
+        data = self.objects[Key]
+        if Range is None:
+            return {'Body': FakeAioBody(data), 'ContentLength': len(data)}
+        start, end = (int(i) for i in Range[len('bytes='):].split('-'))
+        data = data[start:end + 1]
+        return {
+            'Body': FakeAioBody(data),
+            'ContentLength': len(data),
+            'ContentRange': 'bytes {}-{}/{}'.format(start, start + len(data) - 1, len(self.objects[Key])),
+        }
+
+    async def create_multipart_upload(self, Bucket, Key):
+        self.parts[Key] = {}
+        return {'UploadId': 'up'}
+
+    async def upload_part(self, Body, Bucket, Key, PartNumber, UploadId):
+        self._request()
+        self.parts[Key][PartNumber] = bytes(Body.read())
+        return {'ETag': 'e{}'.format(PartNumber)}
+
+    async def complete_multipart_upload(self, Bucket, Key, UploadId, MultipartUpload):
+        parts = self.parts.pop(Key)
+        self.objects[Key] = b''.join(parts[part['PartNumber']] for part in MultipartUpload['Parts'])
+
+    async def abort_multipart_upload(self, Bucket, Key, UploadId):
+        del self.parts[Key]
+
+
+class FakeAioboto3():
+    """ Replaces the aioboto3 module """
+    def __init__(self):
+        self.s3 = FakeAioS3()
+        self.client_kwargs = None
+        fake = self
+
+        class Session():
+            def client(self, service_name, **kwargs):
+                fake.client_kwargs = kwargs
+                return fake
+
+        self.Session = Session
+
+    async def __aenter__(self):
+        return self.s3
+
+    async def __aexit__(self, *exc_info):
+        pass
+
+
+def test_asyncio(monkeypatch, http_defaults):
+    aioboto3 = FakeAioboto3()
+    monkeypatch.setattr(s3, 'aioboto3', aioboto3)
+    backend = _backend(use_asyncio='true', multipart_chunksize=5 * MiB, download_chunksize=MiB)
+    assert isinstance(aioboto3.client_kwargs['config'], s3.BotoCoreClientConfig)
+
+    statuses = []
+    aioboto3.s3.on_request = lambda: statuses.append(backend.thread_status())
+    small = os.urandom(1000)
+    large = os.urandom(10 * MiB + 10)
+    uids = {}
+    for data in (small, large):
+        uids[data] = backend.save(data, _sync=True)
+    assert aioboto3.s3.objects[uids[small]] == small
+    assert aioboto3.s3.objects[uids[large]] == large
+    assert aioboto3.s3.parts == {}
+    assert all('DaBaW: N{} W1 '.format(len(backend.writer_thread_status) - 1) in status for status in statuses)
+
+    statuses.clear()
+    aioboto3.s3.get_timeouts = 1
+    for id_, data in enumerate((small, large)):
+        block = Block(id_, uids[data], len(data), 0, None)
+        assert backend.read(block, sync=True) == data
+    assert aioboto3.s3.get_timeouts == 0
+    assert all('DaBaR: N{} R1 '.format(len(backend.reader_thread_status) - 1) in status for status in statuses)
+    assert 'DaBaR: N{} R0 '.format(len(backend.reader_thread_status)) in backend.thread_status()
+
+    backend.read(Block(2, 'missing', 10, 0, None))
+    wait(list(backend._read_futures))
+    assert isinstance(backend.last_exception, FileNotFoundError)
+
+    backend.close()
+    backend.close()
+
+
+def test_asyncio_client(http_defaults):
+    """ aiobotocore accepts the client config and closes cleanly """
+    pytest.importorskip('aioboto3')
+    backend = _backend(use_asyncio='true')
+    assert backend._loop is not None
+    backend.close()
+    backend.close()
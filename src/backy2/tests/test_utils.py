@@ -0,0 +1,66 @@
+import pytest
+import queue
+import threading
+import backy2.utils
+from backy2.utils import HandoffQueue, TokenBucket
+
+
+def test_handoffqueue_fifo():
+    q = HandoffQueue(3)
+    for i in range(3):
+        q.put(i)
+    assert q.qsize() == 3
+    assert [q.get() for i in range(3)] == [0, 1, 2]
+    assert q.qsize() == 0
+
+
+def test_handoffqueue_put_blocks_when_full():
+    q = HandoffQueue(1)
+    q.put(1)
+    put = threading.Thread(target=q.put, args=(2,))
+    put.start()
+    put.join(0.1)
+    assert put.is_alive()  # blocked, the queue is full
+    assert q.get() == 1
+    put.join(1)
+    assert not put.is_alive()
+    assert q.get() == 2
+
+
+def test_handoffqueue_get_timeout():
+    q = HandoffQueue(1)
+    with pytest.raises(queue.Empty):
+        q.get(timeout=0.01)
+    q.put(1)
+    assert q.get(timeout=0.01) == 1
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [0]  # ns
+    monkeypatch.setattr(backy2.utils, 'monotonic_ns', lambda: now[0])
+    return now
+
+
+def test_tokenbucket_disabled(clock):
+    bucket = TokenBucket()
+    bucket.set_rate(0)
+    assert bucket.consume(10**9) == 0
+
+
+def test_tokenbucket_burst(clock):
+    bucket = TokenBucket()
+    bucket.set_rate(1000)  # tokens per second, the bucket starts full
+    assert bucket.consume(600) == 0
+    assert bucket.consume(400) == 0
+
+
+def test_tokenbucket_overdraft(clock):
+    bucket = TokenBucket()
+    bucket.set_rate(1000)
+    assert bucket.consume(1500) == 0.5  # 500 tokens missing at 1000/s
+    clock[0] += 10**9 // 4  # refills 250 tokens
+    assert bucket.consume(0) == 0.25
+    clock[0] += 5 * 10**9 // 4  # refills the missing 250 and 1000 tokens
+    assert bucket.consume(1000) == 0
+    assert bucket.consume(1) == 0.001
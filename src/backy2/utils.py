@@ -2,13 +2,14 @@
 # -*- encoding: utf-8 -*-
 
 from functools import partial
-from time import time
-from threading import Lock
+from time import monotonic_ns, time
+from threading import Lock, Semaphore
 import binascii
 import itertools
 import hashlib
 import importlib
 import json
+import queue
 import random
 from datetime import timedelta, datetime
 
@@ -152,41 +153,73 @@ def chunks(lst, n):
 class TokenBucket:
     """
     An implementation of the token bucket algorithm.
+    Tokens are held as integer token-nanoseconds, so refilling and computing
+    the recommended nap need no float arithmetic.
     """
+    NS = 10**9
+
     def __init__(self):
-        self.tokens = 0
-        self.rate = 0
-        self.last = time()
+        self.tokens = 0  # token-nanoseconds
+        self.rate = 0  # tokens per second
+        self.last = monotonic_ns()
         self.lock = Lock()
 
 
     def set_rate(self, rate):
         with self.lock:
             self.rate = rate
-            self.tokens = self.rate
+            self.tokens = self.rate * self.NS
 
 
     def consume(self, tokens):
+        """ Returns the recommended nap in seconds. Callers should skip this
+        altogether if self.rate is 0 (i.e. throttling is disabled).
+        """
         with self.lock:
             if not self.rate:
                 return 0
 
-            now = time()
+            now = monotonic_ns()
             lapse = now - self.last
             self.last = now
-            self.tokens += lapse * self.rate
+            self.tokens = min(self.tokens + lapse * self.rate, self.rate * self.NS)
 
-            if self.tokens > self.rate:
-                self.tokens = self.rate
-
-            self.tokens -= tokens
+            self.tokens -= tokens * self.NS
 
             if self.tokens >= 0:
-                #print("Tokens: {}".format(self.tokens))
                 return 0
             else:
-                #print("Recommended nap: {}".format(-self.tokens / self.rate))
-                return -self.tokens / self.rate
+                nap_ns = -self.tokens // self.rate
+                return nap_ns / self.NS
+
+
+class HandoffQueue():
+    """
+    A bounded FIFO for handing results from worker threads to a consumer.
+    put() blocks while maxsize entries are queued, get() raises queue.Empty
+    after timeout like queue.Queue does. It's a queue.SimpleQueue (implemented
+    in C, a single lock and no task_done()/join() bookkeeping) with a
+    semaphore for backpressure.
+    """
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._entries = queue.SimpleQueue()
+        self._free = Semaphore(maxsize)
+
+
+    def put(self, entry):
+        self._free.acquire()
+        self._entries.put(entry)
+
+
+    def get(self, timeout=None):
+        entry = self._entries.get(timeout=timeout)  # raises queue.Empty
+        self._free.release()
+        return entry
+
+
+    def qsize(self):
+        return self._entries.qsize()
 
 
 def generate_block(id_, size):